@@ -1,19 +1,40 @@
 import requests
-import re
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from http.cookiejar import DefaultCookiePolicy
+import threading
+from itertools import chain
+from operator import itemgetter
+import ahocorasick
+from cachetools import TTLCache
 from typing import Dict, List, Optional
+from urllib.parse import urlparse
 import logging
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
+# Upper bound on how much of a page is downloaded and scanned
+_MAX_CONTENT_BYTES = 512 * 1024
+_CHUNK_SIZE = 64 * 1024
+
+# Shared session so page fetches reuse pooled connections. It accepts no cookies, so
+# the jar can't grow with every analyzed site or leak state into later fetches, and it
+# doesn't retry, so a dead host costs one timeout like a plain requests.get.
+_SESSION = requests.Session()
+_SESSION.headers['User-Agent'] = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+_SESSION.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+_ADAPTER = HTTPAdapter(pool_connections=32, pool_maxsize=64)
+_SESSION.mount('https://', _ADAPTER)
+_SESSION.mount('http://', _ADAPTER)
+
+# Per-domain detection results are reused for this long
+_CACHE_MAXSIZE = 1024
+_CACHE_TTL = 3600
+
 class AdProviderDetector:
     """Detects ad providers from website HTML source and returns appropriate exclusions"""
     
     def __init__(self):
-        # Regex for AdThrive subdomain detection
-        self.ADTHRIVE_HOST_RE = re.compile(r"https?://([a-z0-9-]+\.)*adthrive\.com/", re.I)
-        
         self.ad_providers = {
             "Mediavine": {
                 "domains": ["scripts.mediavine.com", "ads.mediavine.com"],
@@ -214,11 +235,42 @@ class AdProviderDetector:
                 ]
             }
         }
+        
+        # Single automaton over every provider's domains and patterns
+        self._automaton = self._build_automaton()
+        
+        # Detection results keyed by domain, shared across requests and endpoints
+        self._cache = TTLCache(maxsize=_CACHE_MAXSIZE, ttl=_CACHE_TTL)
+        self._cache_lock = threading.Lock()
+        self._cache_hits = 0
+        self._cache_misses = 0
+    
+    def _build_automaton(self) -> ahocorasick.Automaton:
+        """
+        Build an Aho-Corasick automaton mapping each lowercased domain/pattern
+        to the providers it identifies
+        
+        Returns:
+            Automaton ready for a single-pass scan of page content
+        """
+        automaton = ahocorasick.Automaton()
+        
+        for provider_name, provider_config in self.ad_providers.items():
+            for token in provider_config["domains"] + provider_config["patterns"]:
+                token = token.lower()
+                providers = automaton.get(token, ())
+                if provider_name not in providers:
+                    automaton.add_word(token, providers + (provider_name,))
+        
+        automaton.make_automaton()
+        return automaton
     
     def get_ad_exclusions(self, url: str, timeout: int = 10) -> Dict[str, List[str]]:
         """
         Detect ad providers from a given URL and return exclusions
         
+        Successful results are cached per domain for _CACHE_TTL seconds.
+        
         Args:
             url: The URL to analyze
             timeout: Request timeout in seconds
@@ -226,107 +278,143 @@ class AdProviderDetector:
         Returns:
             Dictionary with 'rucss_exclusions' and 'delay_js_exclusions' lists
         """
-        exclusions = {
-            'rucss_exclusions': [],
-            'delay_js_exclusions': [],
-            'rucss_excluded_selectors': [],
-            'minify_css_exclusions': [],
-            'js_exclusions': [],
-            'minify_js_exclusions': []
-        }
+        return self.detect_ad_providers(url, timeout)['exclusions']
+    
+    def detect_ad_providers(self, url: str, timeout: int = 10) -> Dict:
+        """
+        Detect ad providers from a given URL
         
-        detected_providers = []
+        Shares the per-domain cache with get_ad_exclusions, so analyzing a
+        domain through either method fetches the page at most once per TTL.
         
-        try:
-            # Ensure URL has protocol
-            if not url.startswith(('http://', 'https://')):
-                url = 'https://' + url
-            
-            # Fetch the webpage
-                'exclusions': exclusions,
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-            }
-            
-            response = requests.get(url, headers=headers, timeout=timeout)
-            response.raise_for_status()
-            
-            html_content = response.text
-            
-            # Parse HTML to extract script sources
-            soup = BeautifulSoup(html_content, 'html.parser')
-            scripts = soup.find_all('script')
-            script_sources = []
-            
-            for script in scripts:
-                if script.get('src'):
-                    script_sources.append(script.get('src'))
-            
-            # Check each ad provider
-            for provider_name, provider_config in self.ad_providers.items():
-                detected = self._check_provider(html_content, script_sources, provider_config)
-                
-                if detected:
-                    detected_providers.append(provider_name)
-            
-            # Only apply exclusions for detected providers
-            for provider_name in detected_providers:
-                logger.info(f"Ad provider detected: {provider_name}")
-                provider_config = self.ad_providers[provider_name]
-                exclusions['rucss_exclusions'].extend(provider_config.get('rucss_exclusions', []))
-                exclusions['delay_js_exclusions'].extend(provider_config.get('delay_js_exclusions', []))
-                exclusions['rucss_excluded_selectors'].extend(provider_config.get('rucss_excluded_selectors', []))
-                exclusions['minify_css_exclusions'].extend(provider_config.get('minify_css_exclusions', []))
-                exclusions['js_exclusions'].extend(provider_config.get('js_exclusions', []))
-                exclusions['minify_js_exclusions'].extend(provider_config.get('minify_js_exclusions', []))
-            
-            if detected_providers:
-                logger.info(f"Total ad providers detected: {', '.join(detected_providers)}")
-            else:
-                logger.info("No ad providers detected")
-            
-            return exclusions
+        Args:
+            url: The URL to analyze
+            timeout: Request timeout in seconds
             
+        Returns:
+            Dictionary with 'success', 'url', 'detected_providers' and
+            'exclusions' (plus 'error' when the page could not be analyzed)
+        """
+        # Ensure URL has protocol
+        if not url.startswith(('http://', 'https://')):
+            url = 'https://' + url
+        
+        try:
+            detected_providers, exclusions = self._analyze(url, timeout)
         except requests.exceptions.RequestException as e:
             logger.error(f"Error fetching URL {url}: {e}")
-            return exclusions
+            return self._detection_result(url, (), self._empty_exclusions(), error=str(e))
         except Exception as e:
             logger.error(f"Error analyzing URL {url}: {e}")
-            return exclusions
+            return self._detection_result(url, (), self._empty_exclusions(), error=str(e))
+        
+        return self._detection_result(url, detected_providers, exclusions)
+    
+    def cache_info(self) -> Dict[str, int]:
+        """Return hit/miss counters and occupancy of the per-domain detection cache"""
+        with self._cache_lock:
+            return {
+                'hits': self._cache_hits,
+                'misses': self._cache_misses,
+                'maxsize': int(self._cache.maxsize),
+                'currsize': len(self._cache),
+                'ttl': int(self._cache.ttl)
+            }
+    
+    def _analyze(self, url: str, timeout: int):
+        """Return (detected providers, exclusions) for the URL's domain, fetching the page on a cache miss"""
+        cache_key = urlparse(url).netloc.lower()
+        with self._cache_lock:
+            cached = self._cache.get(cache_key)
+            if cached is not None:
+                self._cache_hits += 1
+            else:
+                self._cache_misses += 1
+        if cached is not None:
+            logger.info(f"Using cached ad provider detection for {cache_key}")
+            return cached
+        
+        # Fetch the webpage
+        with _SESSION.get(url, timeout=timeout, stream=True) as response:
+            response.raise_for_status()
+            
+            # Scan the page once for all providers
+            detected_providers = self._detect_providers(response)
+        
+        # Only apply exclusions for detected providers
+        exclusions = self._empty_exclusions()
+        for provider_name in detected_providers:
+            logger.info(f"Ad provider detected: {provider_name}")
+            provider_config = self.ad_providers[provider_name]
+            for key in exclusions:
+                exclusions[key].extend(provider_config.get(key, []))
+        
+        if detected_providers:
+            logger.info(f"Total ad providers detected: {', '.join(detected_providers)}")
+        else:
+            logger.info("No ad providers detected")
+        
+        result = (tuple(detected_providers), exclusions)
+        with self._cache_lock:
+            self._cache[cache_key] = result
+        return result
     
-    def _check_provider(self, html_content: str, script_sources: List[str], provider_config: Dict) -> bool:
+    @staticmethod
+    def _empty_exclusions() -> Dict[str, List[str]]:
+        """Return a fresh exclusions dictionary with every field empty"""
+        return {
+            'rucss_exclusions': [],
+            'delay_js_exclusions': [],
+            'rucss_excluded_selectors': [],
+            'minify_css_exclusions': [],
+            'js_exclusions': [],
+            'minify_js_exclusions': []
+        }
+    
+    @staticmethod
+    def _detection_result(url: str, detected_providers, exclusions: Dict[str, List[str]],
+                          error: Optional[str] = None) -> Dict:
+        """Build a detection result, copying the (possibly cached) provider and exclusion lists"""
+        result = {
+            'success': error is None,
+            'url': url,
+            'detected_providers': list(detected_providers),
+            'exclusions': {key: list(values) for key, values in exclusions.items()}
+        }
+        if error is not None:
+            result['error'] = error
+        return result
+    
+    def _detect_providers(self, response: requests.Response) -> List[str]:
         """
-        Check if a specific ad provider is detected
+        Detect ad providers in a single pass over the streamed page
+        
+        Reading stops once _MAX_CONTENT_BYTES have been received or every
+        provider has been matched.
         
         Args:
-            html_content: Full HTML content of the page
-            script_sources: List of script source URLs
-            provider_config: Configuration for the ad provider
+            response: Streaming response for the page
             
         Returns:
-            True if provider is detected, False otherwise
+            Names of the detected providers, in ad_providers order
         """
-        html_lower = html_content.lower()
+        matched = set()
+        search = None
+        received = 0
         
-        # Check domains and patterns in script sources
-        for script_src in script_sources:
-            src_lower = script_src.lower()
-            
-            # Generic domain contains check
-            for domain in provider_config["domains"]:
-                if domain in src_lower:
-                    return True
+        # Check domains and patterns in HTML content, resuming the automaton across chunks.
+        # All tokens are ASCII, so latin-1 maps bytes to text 1:1 without charset detection.
+        for chunk in response.iter_content(_CHUNK_SIZE):
+            received += len(chunk)
+            text = chunk.decode('latin-1')
             
-            # Special case: any *.adthrive.com subdomain
-            if self.ADTHRIVE_HOST_RE.search(script_src):
-                return True
+            if search is None:
+                search = self._automaton.iter(text.lower())
+            else:
+                search.set(text.lower())
+            matched.update(chain.from_iterable(map(itemgetter(1), search)))
             
-            # Common filenames/paths that indicate AdThrive/Raptive
-            if "ads.min.js" in src_lower or "/sites/" in src_lower:
-                return True
-        
-        # Check patterns in HTML content
-        for pattern in provider_config["patterns"]:
-            if pattern.lower() in html_lower:
-                return True
+            if received >= _MAX_CONTENT_BYTES or len(matched) == len(self.ad_providers):
+                break
         
-        return False
\ No newline at end of file
+        return [provider_name for provider_name in self.ad_providers if provider_name in matched]
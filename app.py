@@ -1,16 +1,15 @@
 import os
-import json
 import logging
 import re
-import copy
+import time
+from functools import lru_cache
+from itertools import chain
 from datetime import datetime
-from urllib.parse import urljoin, urlparse
-import requests
-from bs4 import BeautifulSoup
-from flask import Flask, request, jsonify, Response
-from flask import Flask, request, jsonify, Response, send_file, session
-from typing import Dict, List, Optional, Tuple, Any
-import tempfile
+import orjson
+from flask import Flask, request, jsonify, Response, send_file
+from flask.json.provider import DefaultJSONProvider
+from typing import Dict, FrozenSet, List, Optional, Tuple, Any
+from io import BytesIO
 from dotenv import load_dotenv
 from ad_detector import AdProviderDetector
 from usage_logger import UsageLogger
@@ -26,92 +25,199 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson for jsonify and request parsing"""
+    
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        return orjson.dumps(obj, default=self.default).decode('utf-8')
+    
+    def loads(self, s: Any, **kwargs: Any) -> Any:
+        return orjson.loads(s)
+
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
+# Compiled templates are reused as-is; only check template files for changes when debugging
+app.config['TEMPLATES_AUTO_RELOAD'] = os.environ.get('DEBUG', 'False').lower() == 'true'
 app.secret_key = os.getenv('SECRET_KEY', 'your-secret-key-change-this-in-production')
 
 # Initialize dashboard manager
 dashboard_manager = None
-app.secret_key = os.getenv('SECRET_KEY', 'your-secret-key-change-this-in-production')
 
-# Initialize dashboard manager
-dashboard_manager = None
+# Assets fields populated with collected exclusions
+EXCLUSION_KEYS = (
+    'js_exclusions',
+    'delay_js_exclusions',
+    'rucss_excluded_stylesheets',
+    'rucss_excluded_selectors',
+    'minify_css_exclusions',
+    'minify_js_exclusions'
+)
+
+# Template and optimization dictionaries read by load_configurations
+TEMPLATE_PATH = os.path.join('templates', 'default_template.json')
+RUCSS_DICTIONARY_PATH = os.path.join('config', 'dictionary_rucss.json')
+DELAYJS_DICTIONARY_PATH = os.path.join('config', 'dictionary_delayjs.json')
+JS_DICTIONARY_PATH = os.path.join('config', 'dictionary_js.json')
+CONFIG_PATHS = (TEMPLATE_PATH, RUCSS_DICTIONARY_PATH, DELAYJS_DICTIONARY_PATH, JS_DICTIONARY_PATH)
+
+# Ad detector exclusion lists feeding each assets field
+AD_EXCLUSION_FIELDS = {
+    'js_exclusions': 'js_exclusions',
+    'rucss_excluded_stylesheets': 'rucss_exclusions',
+    'delay_js_exclusions': 'delay_js_exclusions',
+    'rucss_excluded_selectors': 'rucss_excluded_selectors',
+    'minify_css_exclusions': 'minify_css_exclusions',
+    'minify_js_exclusions': 'minify_js_exclusions'
+}
+
+# Number of serialized /generate-config responses kept per configuration load
+_CONFIG_JSON_CACHE_SIZE = 1024
+
+# Precompiled patterns used by name normalization
+_PLUGIN_VER_RE = re.compile(r'\s+\d+.*$')
+# Theme version suffixes like: -v442, -v4.4.2, -version-1.2.3, etc. Groups are ordered
+# right to left so one pass strips what applying them one after another used to strip
+_THEME_VERSION_RE = re.compile(
+    r'(?:-\d+)?'                      # -442, -123
+    r'(?:-\d+(?:\.\d+)+)?'            # -1.2.3, -4.4.2
+    r'(?:-version-\d+(?:\.\d+)*)?'    # -version-1.2.3
+    r'(?:-v\d+(?:\.\d+)*)?$'          # -v442, -v4.4.2
+)
+
+@lru_cache(maxsize=4096)
+def _normalize_plugin_name(plugin: str) -> str:
+    """Normalize plugin name for dictionary lookup"""
+    # Remove version numbers and common suffixes
+    plugin = plugin.partition('/')[0]  # Remove path after plugin name
+    plugin = _PLUGIN_VER_RE.sub('', plugin)  # Remove version numbers
+    return plugin.lower().replace(' ', '-').replace('_', '-')
+
+@lru_cache(maxsize=4096)
+def _normalize_theme_name(theme: str) -> str:
+    """Normalize theme name for dictionary lookup"""
+    # Remove version suffixes (e.g., brunchpro-v442 -> brunchpro)
+    theme_normalized = theme.lower().replace(' ', '-').replace('_', '-')
+    
+    # Remove common version patterns
+    theme_normalized = _THEME_VERSION_RE.sub('', theme_normalized, count=1)
+    
+    return theme_normalized
 
 class PerfmattersConfigGenerator:
     """Main class for generating Perfmatters configurations"""
     
     def __init__(self):
         self.template_string = ""
+        self.template = {}
         self.rucss_dict = {}
         self.delayjs_dict = {}
         self.js_dict = {}
+        self._plugin_exclusions = {}
+        self._theme_exclusions = {}
+        self._universal_exclusions = ()
+        self._compound_rules = ()
+        self._compound_rules_by_plugin = {}
+        self._unconditional_compound_rules = ()
+        self._config_stamps = None
         self.ad_detector = AdProviderDetector()
         self.load_configurations()
     
     def load_configurations(self):
         """Load default template and optimization dictionaries from files"""
         try:
+            # Skip re-parsing when no file has changed since the last successful load
+            stamps = tuple((st.st_mtime_ns, st.st_size) for st in map(os.stat, CONFIG_PATHS))
+            if stamps == self._config_stamps:
+                logger.info("Configuration files unchanged, keeping loaded configuration")
+                return
+            
+            # Parse everything into locals first; a failure anywhere leaves the loaded configuration untouched
+            
             # Load default template
-            template_path = os.path.join('templates', 'default_template.json')
-            with open(template_path, 'r', encoding='utf-8') as f:
-                self.template_string = f.read().strip()
+            with open(TEMPLATE_PATH, 'r', encoding='utf-8') as f:
+                template_string = f.read().strip()
+            try:
+                template = orjson.loads(template_string)
+            except orjson.JSONDecodeError as e:
+                logger.error(f"Error parsing template JSON at position {e.pos}: {e.msg}")
+                logger.error(f"Template content around error: {template_string[max(0, e.pos-50):e.pos+50]}")
+                raise
             logger.info("Default template loaded successfully")
             
             # Load RUCSS dictionary
-            rucss_path = os.path.join('config', 'dictionary_rucss.json')
-            with open(rucss_path, 'r', encoding='utf-8') as f:
-                self.rucss_dict = json.load(f)
+            with open(RUCSS_DICTIONARY_PATH, 'rb') as f:
+                rucss_dict = orjson.loads(f.read())
             logger.info("RUCSS dictionary loaded successfully")
             
             # Load Delay JS dictionary
-            delayjs_path = os.path.join('config', 'dictionary_delayjs.json')
-            with open(delayjs_path, 'r', encoding='utf-8') as f:
-                self.delayjs_dict = json.load(f)
+            with open(DELAYJS_DICTIONARY_PATH, 'rb') as f:
+                delayjs_dict = orjson.loads(f.read())
             logger.info("Delay JS dictionary loaded successfully")
             
             # Load JS dictionary
-            js_path = os.path.join('config', 'dictionary_js.json')
-            with open(js_path, 'r', encoding='utf-8') as f:
-                self.js_dict = json.load(f)
+            with open(JS_DICTIONARY_PATH, 'rb') as f:
+                js_dict = orjson.loads(f.read())
             logger.info("JS dictionary loaded successfully")
             
+            # Flatten plugin/theme entries of all dictionaries for single-lookup access
+            plugin_exclusions = self._build_exclusion_index('plugins', rucss_dict, delayjs_dict, js_dict)
+            theme_exclusions = self._build_exclusion_index('themes', rucss_dict, delayjs_dict, js_dict)
+            universal_exclusions = self._build_universal_exclusions(rucss_dict, delayjs_dict, js_dict)
+            compound_rules, compound_rules_by_plugin, unconditional_compound_rules = (
+                self._build_compound_rule_index(rucss_dict, delayjs_dict, js_dict)
+            )
+            
+            # Everything parsed; swap in the new configuration together with fresh caches
+            self.template_string = template_string
+            self.template = template
+            self.rucss_dict = rucss_dict
+            self.delayjs_dict = delayjs_dict
+            self.js_dict = js_dict
+            self._plugin_exclusions = plugin_exclusions
+            self._theme_exclusions = theme_exclusions
+            self._universal_exclusions = universal_exclusions
+            self._compound_rules = compound_rules
+            self._compound_rules_by_plugin = compound_rules_by_plugin
+            self._unconditional_compound_rules = unconditional_compound_rules
+            
+            # Start a fresh cache so cached results never mix old and new dictionaries
+            self._config_json = lru_cache(maxsize=_CONFIG_JSON_CACHE_SIZE)(self._serialize_config)
+            self._config_stamps = stamps
+            
         except FileNotFoundError as e:
             logger.error(f"Configuration file not found: {e}")
             raise
-        except json.JSONDecodeError as e:
+        except orjson.JSONDecodeError as e:
             logger.error(f"Invalid JSON in configuration file: {e}")
             raise
     
     def generate_config(self, plugins: List[str], theme: str, domain: Optional[str] = None, 
                        analyze_domain: bool = False, themes: Optional[List[str]] = None,
-                       theme_parent: Optional[str] = None, theme_child: Optional[str] = None) -> Dict[str, Any]:
+                       theme_parent: Optional[str] = None, theme_child: Optional[str] = None,
+                       ad_result: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """Generate Perfmatters configuration based on plugins, theme, and optional domain analysis"""
+        return self._build_config(*self._resolve_inputs(plugins, theme, domain, analyze_domain,
+                                                        themes, theme_parent, theme_child, ad_result))
+    
+    def generate_config_json(self, plugins: List[str], theme: str, domain: Optional[str] = None, 
+                            analyze_domain: bool = False, themes: Optional[List[str]] = None,
+                            theme_parent: Optional[str] = None, theme_child: Optional[str] = None,
+                            ad_result: Optional[Dict[str, Any]] = None) -> bytes:
+        """Generate the configuration as compact JSON bytes, cached per resolved input"""
+        return self._config_json(*self._resolve_inputs(plugins, theme, domain, analyze_domain,
+                                                       themes, theme_parent, theme_child, ad_result))
+    
+    def _resolve_inputs(self, plugins: List[str], theme: str, domain: Optional[str],
+                        analyze_domain: bool, themes: Optional[List[str]],
+                        theme_parent: Optional[str], theme_child: Optional[str],
+                        ad_result: Optional[Dict[str, Any]] = None
+                        ) -> Tuple[Tuple[str, ...], Tuple[str, ...], Tuple[Tuple[str, Tuple[str, ...]], ...]]:
+        """Reduce request parameters to (normalized plugins, normalized themes, ad exclusions)
         
-        processing_info = {
-            'plugins_processed': 0,
-            'themes_processed': 0
-        }
-        
-        # Collect all exclusions
-        js_exclusions = []
-        delay_js_exclusions = []
-        rucss_excluded_stylesheets = []
-        rucss_excluded_selectors = []
-        minify_css_exclusions = []
-        minify_js_exclusions = []
-        
-        # Apply universal exclusions from RUCSS dictionary
-        rucss_universal = self.rucss_dict.get('universal', {})
-        rucss_excluded_stylesheets.extend(rucss_universal.get('rucss_excluded_stylesheets', []))
-        
-        # Apply universal exclusions from Delay JS dictionary
-        delayjs_universal = self.delayjs_dict.get('universal', {})
-        delay_js_exclusions.extend(delayjs_universal.get('delay_js_exclusions', []))
-        
-        # Apply universal exclusions from JS dictionary
-        js_universal = self.js_dict.get('universal', {})
-        js_exclusions.extend(js_universal.get('js_exclusions', []))
+        ad_result, when given, is a detect_ad_providers result for the domain
+        and is used instead of running the detection again.
+        """
         
-        # Apply compound rules (plugin + theme combinations)
         # Process themes (multiple theme support)
         themes_to_process = []
         
@@ -128,240 +234,222 @@ class PerfmattersConfigGenerator:
                 themes_to_process.append(theme)
         
         # Remove duplicates while preserving order
-        seen = set()
-        themes_to_process = [t for t in themes_to_process if not (t in seen or seen.add(t))]
+        themes_to_process = list(dict.fromkeys(themes_to_process))
         
-        # Apply compound rules (plugin + theme combinations)
-        self._apply_compound_rules(
-            plugins, themes_to_process, 
-            js_exclusions, delay_js_exclusions, rucss_excluded_stylesheets,
-            rucss_excluded_selectors, minify_css_exclusions, minify_js_exclusions
-        )
+        # Normalize names once for dictionary lookups, compound rules and the Kadence check
+        normalized_plugins = tuple(_normalize_plugin_name(p) for p in plugins)
+        normalized_themes = tuple(_normalize_theme_name(t) for t in themes_to_process)
         
         # Analyze domain for ad providers if requested
+        ad_exclusions = ()
         if analyze_domain and domain:
             logger.info(f"Analyzing domain for ad providers: {domain}")
-            ad_exclusions = self.ad_detector.get_ad_exclusions(domain)
-            if any(ad_exclusions.values()):
+            if ad_result is None:
+                ad_result = self.ad_detector.detect_ad_providers(domain)
+            detected = ad_result['exclusions']
+            if any(detected.values()):
                 logger.info("Applied ad provider exclusions based on detection")
-                js_exclusions.extend(ad_exclusions['js_exclusions'])
-                rucss_excluded_stylesheets.extend(ad_exclusions['rucss_exclusions'])
-                delay_js_exclusions.extend(ad_exclusions['delay_js_exclusions'])
-                rucss_excluded_selectors.extend(ad_exclusions['rucss_excluded_selectors'])
-                minify_css_exclusions.extend(ad_exclusions['minify_css_exclusions'])
-                minify_js_exclusions.extend(ad_exclusions['minify_js_exclusions'])
+                ad_exclusions = tuple(
+                    (key, tuple(detected[field])) for key, field in AD_EXCLUSION_FIELDS.items()
+                )
         
-        # Process plugins
-        for plugin in plugins:
-            # Get RUCSS exclusions for plugin
-            rucss_plugin_settings = self._get_plugin_rucss_optimizations(plugin)
-            if rucss_plugin_settings:
-                rucss_excluded_stylesheets.extend(rucss_plugin_settings.get('rucss_excluded_stylesheets', []))
-                processing_info['plugins_processed'] += 1
-            
-            # Get Delay JS exclusions for plugin
-            delayjs_plugin_settings = self._get_plugin_delayjs_optimizations(plugin)
-            if delayjs_plugin_settings:
-                delay_js_exclusions.extend(delayjs_plugin_settings.get('delay_js_exclusions', []))
-            
-            # Get JS exclusions for plugin
-            js_plugin_settings = self._get_plugin_js_optimizations(plugin)
-            if js_plugin_settings:
-                js_exclusions.extend(js_plugin_settings.get('js_exclusions', []))
-        
-        # Process each theme (themes_to_process already defined above)
-        for theme_name in themes_to_process:
-            # Get RUCSS exclusions for theme
-            rucss_theme_settings = self._get_theme_rucss_optimizations(theme_name)
-            if rucss_theme_settings:
-                rucss_excluded_stylesheets.extend(rucss_theme_settings.get('rucss_excluded_stylesheets', []))
-                processing_info['themes_processed'] += 1
-            
-            # Get Delay JS exclusions for theme
-            delayjs_theme_settings = self._get_theme_delayjs_optimizations(theme_name)
-            if delayjs_theme_settings:
-                delay_js_exclusions.extend(delayjs_theme_settings.get('delay_js_exclusions', []))
-            
-            # Get JS exclusions for theme
-            js_theme_settings = self._get_theme_js_optimizations(theme_name)
-            if js_theme_settings:
-                js_exclusions.extend(js_theme_settings.get('js_exclusions', []))
+        return normalized_plugins, normalized_themes, ad_exclusions
+    
+    def _build_config(self, normalized_plugins: Tuple[str, ...], normalized_themes: Tuple[str, ...],
+                      ad_exclusions: Tuple[Tuple[str, Tuple[str, ...]], ...]) -> Dict[str, Any]:
+        """Build a fresh configuration dict for resolved inputs"""
         
-        # Update the config with collected exclusions
+        # Collect exclusions (callers cache the serialized result via _config_json)
+        exclusions, plugins_processed, themes_processed = self._merge_exclusions(
+            normalized_plugins, normalized_themes, ad_exclusions
+        )
+        logger.info("Applied optimizations: %d plugins, %d themes", plugins_processed, themes_processed)
         
-        # Parse template and update directly
-        try:
-            final_config = json.loads(self.template_string)
-        except json.JSONDecodeError as e:
-            logger.error(f"Error parsing template JSON at position {e.pos}: {e.msg}")
-            logger.error(f"Template content around error: {self.template_string[max(0, e.pos-50):e.pos+50]}")
-            logger.error(f"Full template content: {self.template_string}")
-            raise
+        # Update the config with collected exclusions
+        final_config = self._copy_template()
         
         # Update the assets section with collected exclusions
         assets = final_config['perfmatters_options']['assets']
-        assets['js_exclusions'] = js_exclusions
-        assets['delay_js_exclusions'] = delay_js_exclusions
-        assets['rucss_excluded_stylesheets'] = rucss_excluded_stylesheets
-        assets['rucss_excluded_selectors'] = rucss_excluded_selectors
-        assets['minify_css_exclusions'] = minify_css_exclusions
-        assets['minify_js_exclusions'] = minify_js_exclusions
+        for key in EXCLUSION_KEYS:
+            assets[key] = list(exclusions[key])
         
         # Special handling for Kadence themes - disable remove_comment_urls
-        if self._is_kadence_theme(themes_to_process):
+        if self._is_kadence_theme(normalized_themes):
             final_config['perfmatters_options']['remove_comment_urls'] = ""
             logger.info("Kadence theme detected - disabled remove_comment_urls")
         
         # Return the complete configuration
         return final_config
-        
-    def _get_plugin_rucss_optimizations(self, plugin: str) -> Optional[Dict[str, Any]]:
-        """Get RUCSS optimizations for a specific plugin"""
-        plugins_config = self.rucss_dict.get('plugins', {})
-        plugin_key = self._normalize_plugin_name(plugin)
-        
-        if plugin_key in plugins_config:
-            logger.info(f"Applied RUCSS optimizations for plugin: {plugin}")
-            return plugins_config[plugin_key]
-        
-        return None
     
-    def _get_plugin_delayjs_optimizations(self, plugin: str) -> Optional[Dict[str, Any]]:
-        """Get Delay JS optimizations for a specific plugin"""
-        plugins_config = self.delayjs_dict.get('plugins', {})
-        plugin_key = self._normalize_plugin_name(plugin)
-        
-        if plugin_key in plugins_config:
-            logger.info(f"Applied Delay JS optimizations for plugin: {plugin}")
-            return plugins_config[plugin_key]
-        
-        return None
+    def _serialize_config(self, normalized_plugins: Tuple[str, ...], normalized_themes: Tuple[str, ...],
+                          ad_exclusions: Tuple[Tuple[str, Tuple[str, ...]], ...]) -> bytes:
+        """Build and serialize the configuration for resolved inputs (cached as _config_json)"""
+        return orjson.dumps(self._build_config(normalized_plugins, normalized_themes, ad_exclusions))
     
-    def _get_plugin_js_optimizations(self, plugin: str) -> Optional[Dict[str, Any]]:
-        """Get JS optimizations for a specific plugin"""
-        plugins_config = self.js_dict.get('plugins', {})
-        plugin_key = self._normalize_plugin_name(plugin)
+    def _merge_exclusions(self, plugins: Tuple[str, ...], themes: Tuple[str, ...],
+                          ad_exclusions: Tuple[Tuple[str, Tuple[str, ...]], ...]
+                          ) -> Tuple[Dict[str, Tuple[str, ...]], int, int]:
+        """Merge universal, compound-rule, ad, plugin and theme exclusions for normalized names
         
-        if plugin_key in plugins_config:
-            logger.info(f"Applied JS optimizations for plugin: {plugin}")
-            return plugins_config[plugin_key]
+        Returns (assets field -> deduplicated exclusions, plugins processed, themes processed).
+        """
+        plugins_processed = 0
+        themes_processed = 0
         
-        return None
-    
-    def _get_theme_rucss_optimizations(self, theme: str) -> Optional[Dict[str, Any]]:
-        """Get RUCSS optimizations for a specific theme"""
-        themes_config = self.rucss_dict.get('themes', {})
-        theme_key = self._normalize_theme_name(theme)
+        # Collect exclusion lists per assets field; they are flattened and deduplicated once at the end
+        exclusions = {key: [] for key in EXCLUSION_KEYS}
         
-        if theme_key in themes_config:
-            logger.info(f"Applied RUCSS optimizations for theme: {theme}")
-            return themes_config[theme_key]
+        # Apply universal exclusions from the RUCSS, Delay JS and JS dictionaries
+        for key, values in self._universal_exclusions:
+            exclusions[key].append(values)
         
-        return None
-    
-    def _get_theme_delayjs_optimizations(self, theme: str) -> Optional[Dict[str, Any]]:
-        """Get Delay JS optimizations for a specific theme"""
-        themes_config = self.delayjs_dict.get('themes', {})
-        theme_key = self._normalize_theme_name(theme)
+        # Apply compound rules (plugin + theme combinations)
+        self._apply_compound_rules(plugins, themes, exclusions)
         
-        if theme_key in themes_config:
-            logger.info(f"Applied Delay JS optimizations for theme: {theme}")
-            return themes_config[theme_key]
+        # Apply detected ad provider exclusions
+        for key, values in ad_exclusions:
+            exclusions[key].append(values)
         
-        return None
+        # Process plugins
+        for plugin in plugins:
+            plugin_entry = self._plugin_exclusions.get(plugin)
+            if plugin_entry:
+                counted, plugin_exclusions = plugin_entry
+                plugins_processed += counted
+                for key, values in plugin_exclusions:
+                    exclusions[key].append(values)
+        
+        # Process each theme
+        for theme_name in themes:
+            theme_entry = self._theme_exclusions.get(theme_name)
+            if theme_entry:
+                counted, theme_exclusions = theme_entry
+                themes_processed += counted
+                for key, values in theme_exclusions:
+                    exclusions[key].append(values)
+        
+        merged = {
+            key: tuple(dict.fromkeys(chain.from_iterable(exclusions[key])))
+            for key in EXCLUSION_KEYS
+        }
+        return merged, plugins_processed, themes_processed
     
-    def _get_theme_js_optimizations(self, theme: str) -> Optional[Dict[str, Any]]:
-        """Get JS optimizations for a specific theme"""
-        themes_config = self.js_dict.get('themes', {})
-        theme_key = self._normalize_theme_name(theme)
-        
-        if theme_key in themes_config:
-            logger.info(f"Applied JS optimizations for theme: {theme}")
-            return themes_config[theme_key]
+    def _copy_template(self) -> Dict[str, Any]:
+        """Copy the parsed template, duplicating only the sections generate_config modifies"""
+        options = self.template['perfmatters_options']
+        return {
+            **self.template,
+            'perfmatters_options': {**options, 'assets': dict(options['assets'])}
+        }
         
-        return None
+    def _build_exclusion_index(self, section: str, rucss_dict: Dict[str, Any], delayjs_dict: Dict[str, Any],
+                               js_dict: Dict[str, Any]) -> Dict[str, Tuple[bool, Tuple[Tuple[str, Tuple[str, ...]], ...]]]:
+        """Merge a 'plugins' or 'themes' section of all dictionaries into name -> (counted, ((assets field, exclusions), ...))
+        
+        Each dictionary contributes only its own assets field; counted marks names with
+        RUCSS settings, which are the ones reported as plugins/themes processed.
+        """
+        # Key by the same normalization applied to request input so every entry is reachable
+        normalize = _normalize_plugin_name if section == 'plugins' else _normalize_theme_name
+        merged = {}
+        counted = set()
+        for dictionary, key in ((rucss_dict, 'rucss_excluded_stylesheets'),
+                                (delayjs_dict, 'delay_js_exclusions'),
+                                (js_dict, 'js_exclusions')):
+            for name, settings in dictionary.get(section, {}).items():
+                name = normalize(name)
+                entry = merged.setdefault(name, {})
+                if settings and dictionary is rucss_dict:
+                    counted.add(name)
+                if settings.get(key):
+                    entry.setdefault(key, []).extend(settings[key])
+        
+        return {
+            name: (name in counted, tuple((key, tuple(values)) for key, values in entry.items()))
+            for name, entry in merged.items()
+            if entry or name in counted
+        }
     
-    def _normalize_plugin_name(self, plugin: str) -> str:
-        """Normalize plugin name for dictionary lookup"""
-        # Remove version numbers and common suffixes
-        plugin = re.sub(r'/.*$', '', plugin)  # Remove path after plugin name
-        plugin = re.sub(r'\s+\d+.*$', '', plugin)  # Remove version numbers
-        return plugin.lower().replace(' ', '-').replace('_', '-')
+    def _build_universal_exclusions(self, rucss_dict: Dict[str, Any], delayjs_dict: Dict[str, Any],
+                                    js_dict: Dict[str, Any]) -> Tuple[Tuple[str, Tuple[str, ...]], ...]:
+        """Collect each dictionary's 'universal' exclusions as ((assets field, exclusions), ...)"""
+        return (
+            ('rucss_excluded_stylesheets',
+             tuple(rucss_dict.get('universal', {}).get('rucss_excluded_stylesheets', ()))),
+            ('delay_js_exclusions',
+             tuple(delayjs_dict.get('universal', {}).get('delay_js_exclusions', ()))),
+            ('js_exclusions',
+             tuple(js_dict.get('universal', {}).get('js_exclusions', ()))),
+        )
     
-    def _normalize_theme_name(self, theme: str) -> str:
-        """Normalize theme name for dictionary lookup"""
-        # Remove version suffixes (e.g., brunchpro-v442 -> brunchpro)
-        theme_normalized = theme.lower().replace(' ', '-').replace('_', '-')
-        
-        # Remove common version patterns
-        import re
-        # Remove patterns like: -v442, -v4.4.2, -version-1.2.3, etc.
-        version_patterns = [
-            r'-v\d+(\.\d+)*$',           # -v442, -v4.4.2
-            r'-version-\d+(\.\d+)*$',    # -version-1.2.3
-            r'-\d+(\.\d+)+$',            # -1.2.3, -4.4.2
-            r'-\d+$'                     # -442, -123
-        ]
-        
-        for pattern in version_patterns:
-            theme_normalized = re.sub(pattern, '', theme_normalized)
-        
-        return theme_normalized
+    def _build_compound_rule_index(self, rucss_dict: Dict[str, Any], delayjs_dict: Dict[str, Any],
+                                   js_dict: Dict[str, Any]) -> Tuple[tuple, Dict[str, Tuple[int, ...]], Tuple[int, ...]]:
+        """Flatten compound rules of all dictionaries (in order) and index them by required plugin
+        
+        Returns (rules, rule indices by required plugin, indices of rules without required plugins).
+        """
+        rules = []
+        by_plugin = {}
+        unconditional = []
+        
+        for dict_name, dictionary in (('rucss', rucss_dict), ('delayjs', delayjs_dict), ('js', js_dict)):
+            for rule_name, rule_config in dictionary.get('compound_rules', {}).items():
+                required_plugins = frozenset(rule_config.get('required_plugins', []))
+                rule_exclusions = tuple(
+                    (key, tuple(rule_config[key])) for key in EXCLUSION_KEYS if rule_config.get(key)
+                )
+                index = len(rules)
+                rules.append((dict_name, rule_name, required_plugins, rule_config.get('required_theme'), rule_exclusions))
+                
+                for required_plugin in required_plugins:
+                    by_plugin.setdefault(required_plugin, []).append(index)
+                if not required_plugins:
+                    unconditional.append(index)
+        
+        return (
+            tuple(rules),
+            {plugin: tuple(indices) for plugin, indices in by_plugin.items()},
+            tuple(unconditional)
+        )
     
-    def _apply_compound_rules(self, plugins: List[str], themes: List[str],
-                            js_exclusions: List[str], delay_js_exclusions: List[str],
-                            rucss_excluded_stylesheets: List[str], rucss_excluded_selectors: List[str],
-                            minify_css_exclusions: List[str], minify_js_exclusions: List[str]):
-        """Apply compound rules that require specific plugin+theme combinations"""
-        
-        # Normalize plugin and theme names for comparison
-        normalized_plugins = [self._normalize_plugin_name(p) for p in plugins]
-        normalized_themes = [self._normalize_theme_name(t) for t in themes]
-        
-        # Check compound rules in each dictionary
-        dictionaries = [
-            ('rucss', self.rucss_dict),
-            ('delayjs', self.delayjs_dict), 
-            ('js', self.js_dict)
-        ]
-        
-        for dict_name, dictionary in dictionaries:
-            compound_rules = dictionary.get('compound_rules', {})
-            
-            for rule_name, rule_config in compound_rules.items():
-                if self._check_compound_rule(rule_config, normalized_plugins, normalized_themes):
-                    logger.info(f"Applied compound rule: {rule_name} from {dict_name} dictionary")
-                    
-                    # Apply exclusions from this compound rule
-                    js_exclusions.extend(rule_config.get('js_exclusions', []))
-                    delay_js_exclusions.extend(rule_config.get('delay_js_exclusions', []))
-                    rucss_excluded_stylesheets.extend(rule_config.get('rucss_excluded_stylesheets', []))
-                    rucss_excluded_selectors.extend(rule_config.get('rucss_excluded_selectors', []))
-                    minify_css_exclusions.extend(rule_config.get('minify_css_exclusions', []))
-                    minify_js_exclusions.extend(rule_config.get('minify_js_exclusions', []))
+    def _apply_compound_rules(self, plugins: Tuple[str, ...], themes: Tuple[str, ...],
+                            exclusions: Dict[str, List[List[str]]]):
+        """Apply compound rules that require specific plugin+theme combinations (names already normalized)"""
+        
+        # Hash sets for the membership checks of every candidate rule
+        plugin_set = frozenset(plugins)
+        theme_set = frozenset(themes)
+        
+        # Only rules naming one of the present plugins (or none at all) can match
+        candidates = set(self._unconditional_compound_rules)
+        for plugin in plugin_set:
+            candidates.update(self._compound_rules_by_plugin.get(plugin, ()))
+        
+        # Evaluate in dictionary order so exclusions keep their first-seen order
+        for index in sorted(candidates):
+            dict_name, rule_name, required_plugins, required_theme, rule_exclusions = self._compound_rules[index]
+            if self._check_compound_rule(required_plugins, required_theme, plugin_set, theme_set):
+                logger.info(f"Applied compound rule: {rule_name} from {dict_name} dictionary")
+                
+                # Apply exclusions from this compound rule
+                for key, values in rule_exclusions:
+                    exclusions[key].append(values)
     
-    def _check_compound_rule(self, rule_config: Dict, plugins: List[str], themes: List[str]) -> bool:
+    def _check_compound_rule(self, required_plugins: FrozenSet[str], required_theme: Optional[str],
+                             plugins: FrozenSet[str], themes: FrozenSet[str]) -> bool:
         """Check if a compound rule's conditions are met"""
         
         # Check required theme (if specified)
-        required_theme = rule_config.get('required_theme')
         if required_theme and required_theme not in themes:
             return False
         
         # Check required plugins (all must be present)
-        required_plugins = rule_config.get('required_plugins', [])
-        for required_plugin in required_plugins:
-            if required_plugin not in plugins:
-                return False
-        
-        return True
+        return required_plugins <= plugins
     
-    def _is_kadence_theme(self, themes: List[str]) -> bool:
-        """Check if any of the themes is Kadence-based"""
-        for theme in themes:
-            if 'kadence' in theme.lower():
-                return True
-        return False
+    def _is_kadence_theme(self, themes: Tuple[str, ...]) -> bool:
+        """Check if any of the (normalized, lowercase) themes is Kadence-based"""
+        # The NUL separator cannot be part of 'kadence', so matches never span two names
+        return 'kadence' in '\x00'.join(themes)
 
 # Global instance
 config_generator = PerfmattersConfigGenerator()
@@ -373,22 +461,42 @@ dashboard_manager.setup_routes(app)
 
 def get_client_ip():
     """Get client IP address from request headers"""
-    if request.headers.get('X-Forwarded-For'):
-        return request.headers.get('X-Forwarded-For').split(',')[0].strip()
-    elif request.headers.get('X-Real-IP'):
-        return request.headers.get('X-Real-IP')
-    else:
-        return request.remote_addr
+    headers = request.headers
+    forwarded_for = headers.get('X-Forwarded-For')
+    if forwarded_for:
+        return forwarded_for.split(',')[0].strip()
+    real_ip = headers.get('X-Real-IP')
+    if real_ip:
+        return real_ip
+    return request.remote_addr
+
+# (epoch second, ISO-8601 string) most recently formatted by _iso_now
+_iso_cache = (0, '')
+
+def _iso_now() -> str:
+    """Current local time as an ISO-8601 string, formatted at most once per second"""
+    global _iso_cache
+    second = int(time.time())
+    cached_second, cached_iso = _iso_cache
+    if second != cached_second:
+        cached_iso = datetime.fromtimestamp(second).isoformat()
+        _iso_cache = (second, cached_iso)
+    return cached_iso
+
+@lru_cache(maxsize=2)
+def _health_body(timestamp: str) -> bytes:
+    """Serialized health response, rebuilt whenever the timestamp changes"""
+    return orjson.dumps({
+        'status': 'healthy',
+        'timestamp': timestamp,
+        'version': '1.0.0'
+    })
 
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
     usage_logger.log_health_check(user_ip=get_client_ip())
-    return jsonify({
-        'status': 'healthy',
-        'timestamp': datetime.now().isoformat(),
-        'version': '1.0.0'
-    })
+    return Response(_health_body(_iso_now()), mimetype='application/json')
 
 @app.route('/generate-config', methods=['POST'])
 def generate_config():
@@ -396,8 +504,13 @@ def generate_config():
     user_ip = get_client_ip()
     user_agent = request.headers.get('User-Agent', 'Unknown')
     
+    # Defaults for failure logging if the request fails before they are read
+    plugins, theme, themes = [], '', []
+    theme_parent, theme_child, domain, analyze_domain = '', '', '', False
+    
     try:
-        data = request.get_json()
+        # Parse the body once; malformed JSON yields None instead of raising
+        data = request.get_json(silent=True)
         
         if not data:
             return jsonify({
@@ -433,26 +546,25 @@ def generate_config():
                 'error': 'Plugins must be provided as a list'
             }), 400
         
-        # Generate configuration
-        config_result = config_generator.generate_config(
+        # Detect ad providers once; the result feeds both the exclusions and the usage log
+        ad_result = None
+        detected_ad_providers = []
+        if analyze_domain and domain:
+            ad_result = config_generator.ad_detector.detect_ad_providers(domain)
+            detected_ad_providers = ad_result['detected_providers']
+        
+        # Generate configuration, serialized once (and cached) for both the usage log and the download
+        config_json = config_generator.generate_config_json(
             plugins=plugins,
             theme=theme,
             themes=themes,
             theme_parent=theme_parent,
             theme_child=theme_child,
             domain=domain,
-            analyze_domain=analyze_domain
+            analyze_domain=analyze_domain,
+            ad_result=ad_result
         )
         
-        # Get detected ad providers for logging
-        detected_ad_providers = []
-        if analyze_domain and domain:
-            try:
-                ad_result = config_generator.ad_detector.detect_ad_providers(domain)
-                detected_ad_providers = ad_result.get('detected_providers', [])
-            except Exception:
-                pass  # Don't fail the main request if ad detection logging fails
-        
         # Log successful usage
         usage_logger.log_config_generation(
             plugins=plugins,
@@ -463,26 +575,26 @@ def generate_config():
             domain=domain,
             analyze_domain=analyze_domain,
             detected_ad_providers=detected_ad_providers,
-            generated_config=config_result,
+            config_json=config_json,
             user_ip=user_ip,
             user_agent=user_agent,
             success=True
         )
         
-        # Prepare response
-        # Create a temporary file with the JSON config
-        temp_file = tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False)
-        json.dump(config_result, temp_file, separators=(',', ':'), ensure_ascii=False, indent=2)
-        temp_file.close()
-        
         # Generate filename based on plugins and theme
         plugins_str = '-'.join(plugins[:3]) if plugins else 'no-plugins'  # Limit to first 3 plugins
         theme_str = theme if theme else 'no-theme'
         filename = f"perfmatters-config-{plugins_str}-{theme_str}.json"
         
+        # Compact by default; ?pretty=1 returns an indented file for human readers
+        if request.args.get('pretty') == '1':
+            body = orjson.dumps(orjson.loads(config_json), option=orjson.OPT_INDENT_2)
+        else:
+            body = config_json
+        
         # Return the file as download
         return send_file(
-            temp_file.name,
+            BytesIO(body),
             as_attachment=True,
             download_name=filename,
             mimetype='application/json'
@@ -493,23 +605,23 @@ def generate_config():
         
         # Log failed usage
         usage_logger.log_config_generation(
-            plugins=plugins if 'plugins' in locals() else [],
-            theme=theme if 'theme' in locals() else '',
-            themes=themes if 'themes' in locals() else [],
-            theme_parent=theme_parent if 'theme_parent' in locals() else '',
-            theme_child=theme_child if 'theme_child' in locals() else '',
-            domain=domain if 'domain' in locals() else '',
-            analyze_domain=analyze_domain if 'analyze_domain' in locals() else False,
+            plugins=plugins,
+            theme=theme,
+            themes=themes,
+            theme_parent=theme_parent,
+            theme_child=theme_child,
+            domain=domain,
+            analyze_domain=analyze_domain,
             user_ip=user_ip,
-            user_agent=user_agent if 'user_agent' in locals() else 'Unknown',
+            user_agent=user_agent,
             success=False,
             error_message=str(e)
         )
         
-        return Response(json.dumps({
+        return Response(orjson.dumps({
             'success': False,
             'error': str(e)
-        }, separators=(',', ':')), status=500, mimetype='application/json')
+        }), status=500, mimetype='application/json')
 
 @app.route('/reload-config', methods=['POST'])
 def reload_config():
@@ -521,7 +633,7 @@ def reload_config():
         return jsonify({
             'success': True,
             'message': 'Configuration files reloaded successfully',
-            'timestamp': datetime.now().isoformat()
+            'timestamp': _iso_now()
         })
     except Exception as e:
         logger.error(f"Error reloading config: {e}")
@@ -535,8 +647,13 @@ def reload_config():
 def detect_ads():
     """Endpoint to detect ad providers from a URL"""
     user_ip = get_client_ip()
+    
+    # Default for failure logging if the request fails before the URL is read
+    url = 'Unknown'
+    
     try:
-        data = request.get_json()
+        # Parse the body once; malformed JSON yields None instead of raising
+        data = request.get_json(silent=True)
         
         if not data:
             return jsonify({
@@ -565,9 +682,10 @@ def detect_ads():
         # Log ad detection usage
         usage_logger.log_ad_detection(
             domain=url,
-            detected_providers=result.get('detected_providers', []),
+            detected_providers=result['detected_providers'],
             user_ip=user_ip,
-            success=True
+            success=result['success'],
+            error_message=result.get('error')
         )
         
         return jsonify(result)
@@ -575,7 +693,7 @@ def detect_ads():
     except Exception as e:
         logger.error(f"Error detecting ads: {e}")
         usage_logger.log_ad_detection(
-            domain=url if 'url' in locals() else 'Unknown',
+            domain=url,
             detected_providers=[],
             user_ip=user_ip,
             success=False,
@@ -1,10 +1,12 @@
 import os
-import json
+import hmac
 import logging
 from datetime import datetime
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for, send_file
+from flask import Flask, render_template, request, jsonify, session, redirect, url_for, send_file, send_from_directory
+from werkzeug.exceptions import NotFound
 from werkzeug.security import check_password_hash, generate_password_hash
 import tempfile
+from io import BytesIO
 from typing import Dict, List, Optional
 
 logger = logging.getLogger(__name__)
@@ -17,6 +19,11 @@ class DashboardManager:
         self.usage_logger = usage_logger
         self.dashboard_password = os.getenv('DASHBOARD_PASSWORD', 'admin123')
         
+        # Check if password is hashed (starts with $2b$) once, warning at startup rather than per login
+        self._password_is_hashed = self.dashboard_password.startswith('$2b$')
+        if not self._password_is_hashed:
+            logger.warning("Dashboard password is stored in plain text. Consider hashing it.")
+        
     def setup_routes(self, app):
         """Setup dashboard routes"""
         
@@ -41,14 +48,15 @@ class DashboardManager:
             """Dashboard login page"""
             if request.method == 'POST':
                 password = request.form.get('password', '')
+                client_ip = self._get_client_ip()
                 
                 if self._verify_password(password):
                     session['authenticated'] = True
                     session['login_time'] = datetime.now().isoformat()
-                    logger.info(f"Dashboard login successful from IP: {self._get_client_ip()}")
+                    logger.info(f"Dashboard login successful from IP: {client_ip}")
                     return redirect(url_for('dashboard_home'))
                 else:
-                    logger.warning(f"Dashboard login failed from IP: {self._get_client_ip()}")
+                    logger.warning(f"Dashboard login failed from IP: {client_ip}")
                     return render_template('login.html', error='Invalid password')
             
             return render_template('login.html')
@@ -76,8 +84,8 @@ class DashboardManager:
                 domain = data.get('domain', '')
                 analyze_domain = data.get('analyze_domain', False)
                 
-                # Generate configuration using existing generator
-                config_result = self.config_generator.generate_config(
+                # Generate configuration as orjson-serialized bytes using existing generator
+                config_json = self.config_generator.generate_config_json(
                     plugins=plugins,
                     theme=theme,
                     domain=domain,
@@ -85,9 +93,8 @@ class DashboardManager:
                 )
                 
                 # Create temporary file
-                temp_file = tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False)
-                json.dump(config_result, temp_file, separators=(',', ':'), ensure_ascii=False, indent=2)
-                temp_file.close()
+                with tempfile.NamedTemporaryFile(mode='wb', suffix='.json', delete=False) as temp_file:
+                    temp_file.write(config_json)
                 
                 # Log the generation
                 user_ip = self._get_client_ip()
@@ -96,7 +103,7 @@ class DashboardManager:
                     theme=theme,
                     domain=domain,
                     analyze_domain=analyze_domain,
-                    generated_config=config_result,
+                    config_json=config_json,
                     user_ip=user_ip,
                     user_agent=request.headers.get('User-Agent', 'Dashboard'),
                     success=True
@@ -124,16 +131,16 @@ class DashboardManager:
                 return jsonify({'error': 'Not authenticated'}), 401
             
             try:
-                temp_path = os.path.join(tempfile.gettempdir(), filename)
-                if os.path.exists(temp_path):
-                    return send_file(
-                        temp_path,
-                        as_attachment=True,
-                        download_name=f"perfmatters-config-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json",
-                        mimetype='application/json'
-                    )
-                else:
-                    return jsonify({'error': 'File not found'}), 404
+                # send_from_directory rejects paths outside the temp dir and raises NotFound for missing files
+                return send_from_directory(
+                    tempfile.gettempdir(),
+                    filename,
+                    as_attachment=True,
+                    download_name=f"perfmatters-config-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json",
+                    mimetype='application/json'
+                )
+            except NotFound:
+                return jsonify({'error': 'File not found'}), 404
             except Exception as e:
                 logger.error(f"Download error: {e}")
                 return jsonify({'error': 'Download failed'}), 500
@@ -145,13 +152,18 @@ class DashboardManager:
                 return jsonify({'error': 'Not authenticated'}), 401
             
             try:
-                recent_usage = self.usage_logger.get_recent_usage(limit=100)
+                # Page through history by id: before_id for older rows, after_id for newer ones
+                limit = min(max(request.args.get('limit', 100, type=int), 1), 500)
+                before_id = request.args.get('before_id', type=int)
+                after_id = request.args.get('after_id', type=int)
+                recent_usage = self.usage_logger.get_recent_usage(limit=limit, before_id=before_id, after_id=after_id)
                 summary = self.usage_logger.get_usage_stats_summary()
                 
                 return jsonify({
                     'success': True,
                     'recent_usage': recent_usage,
-                    'summary': summary
+                    'summary': summary,
+                    'limit': limit
                 })
             except Exception as e:
                 logger.error(f"Error fetching usage stats: {e}")
@@ -165,24 +177,18 @@ class DashboardManager:
             
             try:
                 # Get the specific usage record
-                usage_records = self.usage_logger.get_recent_usage(limit=1000)
-                usage_record = next((r for r in usage_records if r['id'] == usage_id), None)
+                usage_record = self.usage_logger.get_usage_by_id(usage_id)
                 
                 if not usage_record or not usage_record.get('config_json'):
                     return jsonify({'error': 'Config not found'}), 404
                 
-                # Create temporary file with the config
-                temp_file = tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False)
-                temp_file.write(usage_record['config_json'])
-                temp_file.close()
-                
                 # Generate filename
                 timestamp = usage_record.get('timestamp', 'unknown')
                 domain = usage_record.get('domain', 'unknown-domain')
                 filename = f"perfmatters-config-{domain}-{timestamp}.json"
                 
                 return send_file(
-                    temp_file.name,
+                    BytesIO(usage_record['config_json']),
                     as_attachment=True,
                     download_name=filename,
                     mimetype='application/json'
@@ -198,22 +204,22 @@ class DashboardManager:
     def _verify_password(self, password):
         """Verify dashboard password"""
         try:
-            # Check if password is hashed (starts with $2b$)
-            if self.dashboard_password.startswith('$2b$'):
+            if self._password_is_hashed:
                 return check_password_hash(self.dashboard_password, password)
             else:
-                # Plain text comparison (with warning)
-                logger.warning("Dashboard password is stored in plain text. Consider hashing it.")
-                return password == self.dashboard_password
+                # Plain text comparison
+                return hmac.compare_digest(password.encode('utf-8'), self.dashboard_password.encode('utf-8'))
         except Exception as e:
             logger.error(f"Password verification error: {e}")
             return False
     
     def _get_client_ip(self):
         """Get client IP address"""
-        if request.headers.get('X-Forwarded-For'):
-            return request.headers.get('X-Forwarded-For').split(',')[0].strip()
-        elif request.headers.get('X-Real-IP'):
-            return request.headers.get('X-Real-IP')
-        else:
-            return request.remote_addr
\ No newline at end of file
+        headers = request.headers
+        forwarded_for = headers.get('X-Forwarded-For')
+        if forwarded_for:
+            return forwarded_for.split(',')[0].strip()
+        real_ip = headers.get('X-Real-IP')
+        if real_ip:
+            return real_ip
+        return request.remote_addr
\ No newline at end of file
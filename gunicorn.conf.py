@@ -5,8 +5,11 @@ bind = f"{os.getenv('HOST', '127.0.0.1')}:{os.getenv('PORT', '8080')}"
 backlog = 2048
 
 # Worker processes
-workers = int(os.getenv('WORKERS', '2'))
-worker_class = 'sync'
+# One worker per CPU core unless overridden
+workers = int(os.getenv('WORKERS', str(os.cpu_count() or 2)))
+# Threaded workers so requests waiting on domain analysis or the usage DB
+# don't block the whole process
+worker_class = 'gthread'
 worker_connections = 1000
 timeout = 30
 keepalive = 2
@@ -39,5 +42,5 @@ worker_tmp_dir = '/dev/shm'
 # Preload app for better performance
 preload_app = True
 
-# Enable threading
-threads = 1
\ No newline at end of file
+# Threads per worker (gthread)
+threads = int(os.getenv('THREADS', '8'))
\ No newline at end of file
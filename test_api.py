@@ -11,13 +11,17 @@ def test_api():
     """Test the API endpoints"""
     base_url = "http://localhost:8080"
     
+    # Reuse one connection for all requests
+    session = requests.Session()
+    session.headers.update({"Content-Type": "application/json"})
+    
     print("Testing Perfmatters Configuration Generator API...")
     print("-" * 50)
     
     # Test health endpoint
     print("1. Testing health endpoint...")
     try:
-        response = requests.get(f"{base_url}/health")
+        response = session.get(f"{base_url}/health")
         if response.status_code == 200:
             print("✓ Health check passed")
             print(f"   Response: {response.json()}")
@@ -37,10 +41,9 @@ def test_api():
     }
     
     try:
-        response = requests.post(
+        response = session.post(
             f"{base_url}/generate-config",
-            json=test_data,
-            headers={"Content-Type": "application/json"}
+            json=test_data
         )
         
         if response.status_code == 200:
@@ -59,7 +62,7 @@ def test_api():
     # Test config generation with domain analysis
     print("3. Testing config reload...")
     try:
-        response = requests.post(f"{base_url}/reload-config")
+        response = session.post(f"{base_url}/reload-config")
         if response.status_code == 200:
             print("✓ Config reload passed")
             print(f"   Response: {response.json()}")
@@ -73,10 +76,9 @@ def test_api():
     # Test error handling
     print("4. Testing error handling...")
     try:
-        response = requests.post(
+        response = session.post(
             f"{base_url}/generate-config",
-            json={"invalid": "data"},
-            headers={"Content-Type": "application/json"}
+            json={"invalid": "data"}
         )
         
         if response.status_code == 400:
@@ -1,8 +1,11 @@
 import os
-import json
+import atexit
+import queue
+import orjson
 import logging
 import sqlite3
 import threading
+import zlib
 from datetime import datetime
 from typing import Dict, List, Optional, Any
 from slack_sdk import WebClient
@@ -10,6 +13,11 @@ from slack_sdk.errors import SlackApiError
 
 logger = logging.getLogger(__name__)
 
+# Bound on pending background writes/notifications; the oldest are dropped when full
+_QUEUE_MAX_SIZE = 10000
+# Seconds to wait for pending work to drain at interpreter exit
+_FLUSH_TIMEOUT = 5.0
+
 class UsageLogger:
     """Logs API usage and sends notifications to Slack"""
     
@@ -22,6 +30,15 @@ class UsageLogger:
         self.db_lock = threading.Lock()
         self._init_database()
         
+        # Database writes and Slack posts run on a background worker so they stay
+        # off the request path. The worker is started lazily per process because
+        # gunicorn forks workers after the app is preloaded.
+        self._queue = None
+        self._worker = None
+        self._worker_pid = None
+        self._worker_lock = threading.Lock()
+        atexit.register(self.flush, _FLUSH_TIMEOUT)
+        
         # Initialize Slack client if webhook URL is provided
         self.slack_client = None
         if self.slack_webhook_url:
@@ -60,13 +77,67 @@ class UsageLogger:
                 # Create index for faster queries
                 conn.execute('CREATE INDEX IF NOT EXISTS idx_timestamp ON usage_stats(timestamp)')
                 conn.execute('CREATE INDEX IF NOT EXISTS idx_endpoint ON usage_stats(endpoint)')
+                conn.execute('CREATE INDEX IF NOT EXISTS idx_endpoint_created ON usage_stats(endpoint, created_at)')
                 
             logger.info("Usage statistics database initialized")
         except Exception as e:
             logger.error(f"Failed to initialize usage database: {e}")
     
-    def _save_to_database(self, usage_data: Dict[str, Any], config_json: Optional[str] = None):
-        """Save usage data to SQLite database"""
+    def _ensure_worker(self) -> queue.Queue:
+        """Return this process's work queue, starting the worker thread if needed"""
+        pid = os.getpid()
+        if self._worker_pid != pid:
+            with self._worker_lock:
+                if self._worker_pid != pid:
+                    self._queue = queue.Queue(maxsize=_QUEUE_MAX_SIZE)
+                    self._worker = threading.Thread(target=self._run_worker, args=(self._queue,),
+                                                    name='usage-logger', daemon=True)
+                    self._worker.start()
+                    self._worker_pid = pid
+        return self._queue
+    
+    def _run_worker(self, work_queue: queue.Queue) -> None:
+        """Drain deferred logging work until the process exits"""
+        while True:
+            func, args = work_queue.get()
+            try:
+                func(*args)
+            except Exception as e:
+                logger.error(f"Background usage logging failed: {e}")
+            finally:
+                work_queue.task_done()
+    
+    def _defer(self, func, *args) -> None:
+        """Queue func(*args) for the background worker, dropping the oldest item when full"""
+        work_queue = self._ensure_worker()
+        while True:
+            try:
+                work_queue.put_nowait((func, args))
+                return
+            except queue.Full:
+                try:
+                    work_queue.get_nowait()
+                    work_queue.task_done()
+                    logger.warning("Usage logging queue full; dropped oldest pending entry")
+                except queue.Empty:
+                    pass
+    
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait for pending background work; returns False if it did not drain within timeout"""
+        if self._worker_pid != os.getpid() or self._queue is None:
+            return True
+        work_queue = self._queue
+        if timeout is None:
+            work_queue.join()
+            return True
+        with work_queue.all_tasks_done:
+            return work_queue.all_tasks_done.wait_for(lambda: not work_queue.unfinished_tasks, timeout)
+    
+    def _save_to_database(self, usage_data: Dict[str, Any], config_json: Optional[bytes] = None):
+        """Save usage data to SQLite database, storing config_json (UTF-8 JSON) zlib-compressed"""
+        if config_json is not None:
+            config_json = zlib.compress(config_json, 3)
+        
         try:
             with self.db_lock:
                 with sqlite3.connect(self.db_path) as conn:
@@ -89,18 +160,41 @@ class UsageLogger:
         except Exception as e:
             logger.error(f"Failed to save usage data to database: {e}")
     
-    def get_recent_usage(self, limit: int = 50) -> List[Dict[str, Any]]:
-        """Get recent usage statistics from database"""
+    def get_recent_usage(self, limit: int = 50, before_id: Optional[int] = None,
+                         after_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Get a page of recent usage statistics from database
+        
+        Pages are keyed on id, so rows logged in the meantime never shift them:
+        by default and with before_id rows come newest first, while after_id
+        returns the rows following it oldest first so callers can catch up in batches.
+        Records carry a has_config flag instead of the stored config_json;
+        use get_usage_by_id to fetch a single record's config.
+        """
+        conditions = ["endpoint = 'generate-config'"]
+        params = []
+        order = 'DESC'
+        if before_id is not None:
+            conditions.append('id < ?')
+            params.append(before_id)
+        if after_id is not None:
+            conditions.append('id > ?')
+            params.append(after_id)
+            order = 'ASC'
+        params.append(limit)
+        
         try:
             with self.db_lock:
                 with sqlite3.connect(self.db_path) as conn:
                     conn.row_factory = sqlite3.Row
-                    cursor = conn.execute('''
-                        SELECT * FROM usage_stats 
-                        WHERE endpoint = 'generate-config'
-                        ORDER BY created_at DESC 
+                    cursor = conn.execute(f'''
+                        SELECT id, timestamp, endpoint, domain, user_ip, user_agent, plugins_count,
+                               theme, success, error_message, created_at,
+                               config_json IS NOT NULL AS has_config
+                        FROM usage_stats 
+                        WHERE {' AND '.join(conditions)}
+                        ORDER BY id {order}
                         LIMIT ?
-                    ''', (limit,))
+                    ''', params)
                     
                     rows = cursor.fetchall()
                     return [dict(row) for row in rows]
@@ -108,6 +202,31 @@ class UsageLogger:
             logger.error(f"Failed to fetch usage statistics: {e}")
             return []
     
+    def get_usage_by_id(self, usage_id: int) -> Optional[Dict[str, Any]]:
+        """Get a single usage record, including its stored config as JSON bytes, by primary key"""
+        try:
+            with self.db_lock:
+                with sqlite3.connect(self.db_path) as conn:
+                    conn.row_factory = sqlite3.Row
+                    cursor = conn.execute('SELECT * FROM usage_stats WHERE id = ?', (usage_id,))
+                    
+                    row = cursor.fetchone()
+            
+            if not row:
+                return None
+            
+            # config_json is returned as UTF-8 JSON bytes; rows written before
+            # compression was introduced hold plain text
+            record = dict(row)
+            if isinstance(record['config_json'], bytes):
+                record['config_json'] = zlib.decompress(record['config_json'])
+            elif record['config_json'] is not None:
+                record['config_json'] = record['config_json'].encode('utf-8')
+            return record
+        except Exception as e:
+            logger.error(f"Failed to fetch usage record {usage_id}: {e}")
+            return None
+    
     def log_config_generation(self, 
                             plugins: List[str], 
                             theme: str,
@@ -118,11 +237,15 @@ class UsageLogger:
                             analyze_domain: bool = False,
                             detected_ad_providers: Optional[List[str]] = None,
                             generated_config: Optional[Dict] = None,
+                            config_json: Optional[bytes] = None,
                             user_ip: Optional[str] = None,
                             user_agent: Optional[str] = None,
                             success: bool = True,
                             error_message: Optional[str] = None) -> None:
-        """Log configuration generation usage"""
+        """Log configuration generation usage
+        
+        Pass config_json (UTF-8 JSON bytes) when the caller has already serialized generated_config.
+        """
         
         timestamp = datetime.now().isoformat()
         
@@ -148,8 +271,9 @@ class UsageLogger:
         }
         
         # Save to database with config JSON if successful
-        config_json = json.dumps(generated_config) if generated_config else None
-        self._save_to_database(usage_data, config_json)
+        if config_json is None and generated_config:
+            config_json = orjson.dumps(generated_config)
+        self._defer(self._save_to_database, usage_data, config_json)
         
         # Log to application logs
         if success:
@@ -158,7 +282,7 @@ class UsageLogger:
             logger.error(f"Config generation failed - Error: {error_message}")
         
         # Send to Slack
-        self._send_slack_notification(usage_data)
+        self._defer(self._send_slack_notification, usage_data)
     
     def log_ad_detection(self,
                         domain: str,
@@ -182,7 +306,7 @@ class UsageLogger:
         }
         
         # Save to database
-        self._save_to_database(usage_data)
+        self._defer(self._save_to_database, usage_data)
         
         # Log to application logs
         if success:
@@ -191,7 +315,7 @@ class UsageLogger:
             logger.error(f"Ad detection failed - Domain: {domain}, Error: {error_message}")
         
         # Send to Slack (simplified for ad detection)
-        self._send_slack_ad_notification(usage_data)
+        self._defer(self._send_slack_ad_notification, usage_data)
     
     def get_usage_stats_summary(self) -> Dict[str, Any]:
         """Get usage statistics summary"""
@@ -236,12 +360,8 @@ class UsageLogger:
             domain = usage_data['domain'] or 'No domain'
             ip = usage_data['user_ip'] or 'Unknown IP'
             
-            # Format timestamp to readable format
-            try:
-                dt = datetime.fromisoformat(usage_data['timestamp'].replace('Z', '+00:00'))
-                time_str = dt.strftime('%H:%M:%S')
-            except:
-                time_str = 'Unknown time'
+            # HH:MM:SS slice of the ISO timestamp set in log_*
+            time_str = usage_data['timestamp'][11:19] or 'Unknown time'
             
             message = f"{status} {domain} | {ip} | {time_str}"
             
@@ -275,12 +395,8 @@ class UsageLogger:
             domain = usage_data['domain'] or 'No domain'
             ip = usage_data['user_ip'] or 'Unknown IP'
             
-            # Format timestamp
-            try:
-                dt = datetime.fromisoformat(usage_data['timestamp'].replace('Z', '+00:00'))
-                time_str = dt.strftime('%H:%M:%S')
-            except:
-                time_str = 'Unknown time'
+            # HH:MM:SS slice of the ISO timestamp set in log_*
+            time_str = usage_data['timestamp'][11:19] or 'Unknown time'
             
             message = f"{status} [AD] {domain} | {ip} | {time_str}"
             
@@ -300,8 +416,8 @@ class UsageLogger:
             logger.error(f"Failed to send ad detection Slack notification: {e}")
     
     def log_health_check(self, user_ip: Optional[str] = None) -> None:
-        """Log health check (minimal logging)"""
-        logger.info(f"Health check from IP: {user_ip or 'Unknown'}")
+        """Log health check (minimal logging; DEBUG only, as load balancers probe constantly)"""
+        logger.debug("Health check from IP: %s", user_ip or 'Unknown')
     
     def log_config_reload(self, user_ip: Optional[str] = None, success: bool = True, error_message: Optional[str] = None) -> None:
         """Log configuration reload"""
@@ -312,16 +428,20 @@ class UsageLogger:
         
         # Send simple Slack notification for config reloads
         if self.slack_webhook_url:
-            try:
-                status = "✓" if success else "✗"
-                ip = user_ip or 'Unknown IP'
-                
-                payload = {
-                    "channel": self.slack_channel,
-                    "username": "Perfmatters API",
-                    "text": f"{status} [RELOAD] Config {'reloaded' if success else 'reload failed'} | {ip}"
-                }
-                
-                self.requests.post(self.slack_webhook_url, json=payload, timeout=5)
-            except Exception as e:
-                logger.error(f"Failed to send config reload Slack notification: {e}")
\ No newline at end of file
+            self._defer(self._send_slack_reload_notification, user_ip, success)
+    
+    def _send_slack_reload_notification(self, user_ip: Optional[str], success: bool) -> None:
+        """Send config reload notification to Slack"""
+        try:
+            status = "✓" if success else "✗"
+            ip = user_ip or 'Unknown IP'
+            
+            payload = {
+                "channel": self.slack_channel,
+                "username": "Perfmatters API",
+                "text": f"{status} [RELOAD] Config {'reloaded' if success else 'reload failed'} | {ip}"
+            }
+            
+            self.requests.post(self.slack_webhook_url, json=payload, timeout=5)
+        except Exception as e:
+            logger.error(f"Failed to send config reload Slack notification: {e}")
\ No newline at end of file